@@ -0,0 +1,38 @@
+"""empty message
+
+Revision ID: 4b8e2f61a9c3
+Revises: 9d41f6b2c7a8
+Create Date: 2026-10-21 10:15:03.218764
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e2f61a9c3'
+down_revision = '9d41f6b2c7a8'
+branch_labels = None
+depends_on = None
+
+# admin prefix search, only Postgres needs them (SQLite's unique indexes already serve it)
+PATTERN_INDEXES = [
+    ('ix_users_username_pattern', 'users', 'username'),
+    ('ix_users_email_pattern', 'users', 'email'),
+    ('ix_planets_name_pattern', 'planets', 'name'),
+    ('ix_characters_name_pattern', 'characters', 'name'),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, table, column in PATTERN_INDEXES:
+        op.create_index(name, table, [column], unique=False, postgresql_ops={column: 'varchar_pattern_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, table, column in PATTERN_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -1,16 +1,172 @@
 import os
+import threading
+import time
+from flask import current_app
 from flask_admin import Admin
-from models import db, User
+from sqlalchemy import and_, or_, text
+from models import db, User, Planet, Character, Favorite, Post, Job, IdempotencyKey
 from flask_admin.contrib.sqla import ModelView
 
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+
+def approximate_count(model):
+    """
+    Row count for the admin pager without a COUNT(*) on every page load.
+    Postgres uses the planner estimate from pg_class, other databases get an exact count
+    cached for ADMIN_COUNT_CACHE_SECONDS. Small tables are always counted exactly.
+    """
+    table = model.__tablename__
+    threshold = current_app.config.get('ADMIN_EXACT_COUNT_BELOW', 10000)
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+        ).scalar()
+        # reltuples is -1 (or missing) until the table has been analyzed
+        if estimate is not None and estimate >= threshold:
+            return estimate
+        return db.session.query(db.func.count('*')).select_from(model).scalar()
+
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(table)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    count = db.session.query(db.func.count('*')).select_from(model).scalar()
+    with _count_cache_lock:
+        _count_cache[table] = (count, now + current_app.config.get('ADMIN_COUNT_CACHE_SECONDS', 60))
+    return count
+
+
+def _prefix_match(field, term, dialect):
+    """
+    `field` starts with `term`, written so the column index can serve it. SQLite compares text
+    bytewise (BINARY collation) so a `term <= col < term + U+10FFFF` range is exact and uses the
+    plain index. Elsewhere the collation decides the order and that range can miss or add rows,
+    `LIKE 'term%'` is what the planner turns into an index range there (on Postgres with the
+    varchar_pattern_ops indexes, a plain btree only helps in the C locale).
+    """
+    if dialect == "sqlite":
+        return and_(field >= term, field < term + '\U0010ffff')
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return field.like(escaped + '%', escape='\\')
+
+
+class ApproximateCountQuery:
+    """
+    Stands in for the admin count query: untouched it returns `approximate_count`,
+    as soon as a search or filter narrows it down it turns into the exact count query.
+    """
+
+    def __init__(self, view):
+        self.view = view
+
+    def __getattr__(self, name):
+        return getattr(ModelView.get_count_query(self.view), name)
+
+    def scalar(self):
+        return approximate_count(self.view.model)
+
+
+class BaseModelView(ModelView):
+    # bounded pages, the user can't ask for the whole table at once
+    page_size = 25
+    can_set_page_size = True
+    page_size_options = (10, 25, 50, 100)
+    column_display_pk = True
+    column_default_sort = ('id', True)
+
+    def search_placeholder(self):
+        return 'Starts with...'
+
+    def _get_list_extra_args(self):
+        # page_size_options only feeds the selector, ?page_size= in the url is taken as is
+        view_args = super()._get_list_extra_args()
+        page_size = min(max(view_args.page_size, 0), max(self.page_size_options))
+        return view_args.clone(page_size=page_size)
+
+    def get_count_query(self):
+        return ApproximateCountQuery(self)
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        """
+        Prefix search instead of Flask-Admin's `lower(col) LIKE '%term%'`, which can't use an
+        index (see `_prefix_match`), so keep column_searchable_list to indexed columns.
+        """
+        dialect = db.session.get_bind().dialect.name
+        for term in search.split(' '):
+            if not term:
+                continue
+            stmt = or_(*[_prefix_match(field, term, dialect) for field, path in self._search_fields])
+            query = query.filter(stmt)
+            if count_query is not None:
+                count_query = count_query.filter(stmt)
+        return query, count_query, joins, count_joins
+
+
+class UserView(BaseModelView):
+    column_list = ('id', 'username', 'email', 'created_at', 'is_active')
+    column_searchable_list = ('username', 'email')
+    column_sortable_list = ('id', 'username', 'email')
+
+
+class PlanetView(BaseModelView):
+    column_list = ('id', 'name', 'image_url')
+    column_searchable_list = ('name',)
+    column_sortable_list = ('id', 'name')
+
+
+class CharacterView(BaseModelView):
+    column_list = ('id', 'name', 'planet', 'image_url')
+    column_select_related_list = (Character.planet,)
+    column_searchable_list = ('name',)
+    column_sortable_list = ('id', 'name')
+
+
+class FavoriteView(BaseModelView):
+    column_list = ('id', 'user', 'planet', 'character')
+    column_select_related_list = (Favorite.user, Favorite.planet, Favorite.character)
+    column_sortable_list = ('id',)
+
+
+class PostView(BaseModelView):
+    column_list = ('id', 'title', 'user', 'created_at', 'updated_at')
+    column_select_related_list = (Post.user,)
+    column_sortable_list = ('id', 'created_at')
+
+
+class JobView(BaseModelView):
+    can_create = False
+    can_edit = False
+    column_list = ('id', 'name', 'status', 'attempts', 'last_error', 'run_at', 'created_at')
+    column_sortable_list = ('id',)
+
+
+class IdempotencyKeyView(BaseModelView):
+    can_create = False
+    can_edit = False
+    column_list = ('key', 'status_code', 'created_at')
+    column_default_sort = ('created_at', True)
+    column_sortable_list = ('created_at',)
+
+
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
+
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
+    admin.add_view(UserView(User, db.session))
+    admin.add_view(PlanetView(Planet, db.session))
+    admin.add_view(CharacterView(Character, db.session))
+    admin.add_view(FavoriteView(Favorite, db.session))
+    admin.add_view(PostView(Post, db.session))
+    admin.add_view(JobView(Job, db.session))
+    admin.add_view(IdempotencyKeyView(IdempotencyKey, db.session))
 
-    # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # Subclass BaseModelView to add new models, it keeps the pages bounded and the counts cheap
+    # admin.add_view(BaseModelView(YourModelName, db.session))
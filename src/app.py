@@ -6,9 +6,17 @@ from flask import Flask, request, jsonify, url_for, Blueprint
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
+from utils import APIException, generate_sitemap, create
 from admin import setup_admin
 from models import db, User, Planet, Character, Favorite, Post
+from jobs import jobs
+import tasks
+from snapshot import snapshot_cli
+from seed import seed_command
+from idempotency import idempotent
+from profiling import profiler
+from sqlalchemy import func
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm.exc import NoResultFound
 
 
@@ -21,11 +29,22 @@ if db_url is not None:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['JOBS_DURABLE'] = os.getenv("JOBS_DURABLE", "0") == "1"
+app.config['IDEMPOTENCY_TTL'] = int(os.getenv("IDEMPOTENCY_TTL", 24 * 60 * 60))
+app.config['PLANETS_PAGE_SIZE'] = 50
+app.config['PLANETS_MAX_PAGE_SIZE'] = 100
+app.config['PROFILING_TOKEN'] = os.getenv("PROFILING_TOKEN")
+app.config['PROFILING_SAMPLE_RATE'] = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+app.config['PROFILING_MODE'] = os.getenv("PROFILING_MODE", "cprofile")
 
 MIGRATE = Migrate(app, db)
 db.init_app(app)
+jobs.init_app(app)
+profiler.init_app(app)
 CORS(app)
 setup_admin(app)
+app.cli.add_command(snapshot_cli)
+app.cli.add_command(seed_command)
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
@@ -41,6 +60,7 @@ def sitemap():
 
 # ----------------- users api routes ------------------- #
 @api.route('/users', methods=["POST"])
+@idempotent
 def create_user():
     """
     payload:
@@ -64,15 +84,15 @@ def create_user():
     if not 'password' in data:
         return jsonify({"error": "Bad request, missing password."}), 400
     
-    user: User | None = User.query.filter_by(username=data.get('username')).first()
-    
-    if user:
-        return jsonify({"error": f"Username {data.get('username')} alerady exists."}), 400
+    user: User | None = create(User, username=data.get('username'), email=data.get('email'), password=data.get('password'))
+
+    if not user:
+        if User.query.filter_by(username=data.get('username')).first():
+            return jsonify({"error": f"Username {data.get('username')} alerady exists."}), 400
+        return jsonify({"error": f"Email {data.get('email')} alerady exists."}), 400
 
-    user = User(username=data.get('username'), email=data.get('email'), password=data.get('password'))
-    db.session().add(user)
+    jobs.enqueue("audit_log", action="create", model="User", object_id=user.id)
     db.session.commit()
-    db.session.refresh(user)
 
     return jsonify(user.serialize()), 201    
 
@@ -90,6 +110,7 @@ def get_user_by_username(username):
 
 # ----------------- planet api routes ------------------- #
 @api.route('/planets', methods=["POST"])
+@idempotent
 def create_planet():
     """
     payload:
@@ -113,29 +134,62 @@ def create_planet():
     if not 'image_url' in data:
         return jsonify({"error": "Bad request, missing image_url."}), 400
     
-    planet: Planet | None = Planet.query.filter_by(name=data.get('name')).first()
-    
-    if planet:
+    planet: Planet | None = create(Planet, name=data.get("name"), description=data.get("description"), image_url=data.get("image_url"))
+
+    if not planet:
         return jsonify({"error": f"Name {data.get('name')} alerady exists."}), 400
-    
-    planet = Planet(name=data.get("name"), description=data.get("description"), image_url=data.get("image_url"))
 
-    db.session().add(planet)
+    jobs.enqueue("audit_log", action="create", model="Planet", object_id=planet.id)
     db.session.commit()
-    db.session.refresh(planet)
 
     return jsonify(planet.serialize()), 201
 
+def serialize_planets(planets):
+    """
+    ?residents=count returns a resident_count from one grouped query instead of the resident list,
+    otherwise the residents of all the given planets are fetched with one SELECT ... IN.
+    Either way it's a single extra query for the whole page.
+    """
+    planet_ids = [planet.id for planet in planets]
+    if not planet_ids:
+        return []
+
+    if request.args.get('residents') == 'count':
+        counts = dict(
+            db.session.query(Character.planet_id, func.count(Character.id))
+            .filter(Character.planet_id.in_(planet_ids))
+            .group_by(Character.planet_id)
+            .all()
+        )
+        return [planet.serialize(resident_count=counts.get(planet.id, 0)) for planet in planets]
+
+    residents = {planet_id: [] for planet_id in planet_ids}
+    for character in Character.query.filter(Character.planet_id.in_(planet_ids)).order_by(Character.id):
+        residents[character.planet_id].append(character)
+    for planet in planets:
+        set_committed_value(planet, 'characters', residents[planet.id])
+    return [planet.serialize() for planet in planets]
+
 @api.route('/planets', methods=["GET"])
 def get_planets():
-    planets = Planet.query.all()
-    return jsonify(planets=[planet.serialize() for planet in planets])
+    """
+    query params:
+        limit      (optional) planets per page, defaults to PLANETS_PAGE_SIZE, capped at PLANETS_MAX_PAGE_SIZE
+        offset     (optional) planets to skip
+        residents=count  (optional) resident_count instead of the list of residents
+    """
+    max_limit = app.config['PLANETS_MAX_PAGE_SIZE']
+    limit = min(max(request.args.get('limit', app.config['PLANETS_PAGE_SIZE'], type=int), 1), max_limit)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    planets = Planet.query.order_by(Planet.id).limit(limit).offset(offset).all()
+    return jsonify(planets=serialize_planets(planets), limit=limit, offset=offset)
 
 @api.route('/planets/<string:name>', methods=["GET"])
 def get_planet_by_name(name):
-    planet = Planet.query.filter_by(name=name).first()
-    if planet:
-        return jsonify(planet.serialize()), 200
+    planets = serialize_planets(Planet.query.filter_by(name=name).all())
+    if planets:
+        return jsonify(planets[0]), 200
     return jsonify({"error": f"planet {name} does not exist"}), 404
 
 # ----------------- people api routes ------------------- #
@@ -145,6 +199,7 @@ def get_people():
     return jsonify(people=[person.serialize() for person in people])
 
 @api.route('/people', methods=["POST"])
+@idempotent
 def create_person():
     """
         payload:
@@ -172,11 +227,6 @@ def create_person():
     if not 'planet_id' in data:
         return jsonify({"error": "Bad request, missing image_url."}), 400
     
-    person: Character | None = Character.query.filter_by(name=data.get('name')).first()
-    
-    if person:
-        return jsonify({"error": f"Name {data.get('name')} alerady exists."}), 400
-    
     planet: Planet | None = Planet.query.filter_by(id=data.get('planet_id')).first()
 
     if not planet:
@@ -185,16 +235,19 @@ def create_person():
             "planets": [planet.serialize_slim() for planet in Planet.query.all()]
             }), 400
     
-    person = Character(
+    person: Character | None = create(
+        Character,
         name=data.get("name"), 
         description=data.get("description"), 
         image_url=data.get("image_url"), 
         planet_id=data.get("planet_id")
     )
 
-    db.session().add(person)
+    if not person:
+        return jsonify({"error": f"Name {data.get('name')} alerady exists."}), 400
+
+    jobs.enqueue("audit_log", action="create", model="Character", object_id=person.id)
     db.session.commit()
-    db.session.refresh(person)
 
     return jsonify(person.serialize()), 201
 
@@ -307,6 +360,7 @@ def get_posts(user_id):
     }), 200  
 
 @api.route('/posts/<int:user_id>', methods=["POST"])
+@idempotent
 def create_post(user_id):
     
     user = User.query.filter_by(id=user_id).first()
@@ -324,14 +378,15 @@ def create_post(user_id):
     if not 'content' in data:
         return jsonify({"error": "Bad request, missing content."}), 400
     
-    new_post = Post(
+    # inserted directly instead of user.posts.append() so the collection isn't loaded twice
+    new_post = create(
+        Post,
         title=data.get('title'),
         content = data.get('content'),
         user_id = user.id
     )
 
-    user.posts.append(new_post)
-    db.session().add(new_post)
+    jobs.enqueue("audit_log", action="create", model="Post", object_id=new_post.id, user_id=user.id)
     db.session().commit()
 
     return jsonify({
@@ -343,6 +398,12 @@ def create_post(user_id):
         }
     }), 201 
 
+# ----------------- jobs api routes ------------------- #
+
+@api.route('/jobs/metrics', methods=["GET"])
+def get_job_metrics():
+    return jsonify(jobs.metrics()), 200
+
 app.register_blueprint(api)
 
 with app.test_request_context():
@@ -0,0 +1,262 @@
+"""
+`Idempotency-Key` header support for the POST endpoints.
+
+Before the view runs the key is reserved with a row in the idempotency_keys table, so a
+retry hitting any worker while the first request is running gets a 409. The row is marked
+completed in the same transaction as the view's writes and the response is stored on it
+right after (and in a per process LRU), a retry with the same key gets it back without
+running the view again.
+"""
+import hashlib
+import itertools
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import Response, current_app, g, has_request_context, jsonify, make_response, request
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, IdempotencyKey
+from jobs import jobs
+
+HEADER = "Idempotency-Key"
+
+
+class LRUCache:
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class ReservationLost(Exception):
+    """The key was taken over while the view was running, the view's transaction is rolled back."""
+
+
+cache = LRUCache()
+_stores = itertools.count(1)
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _ttl():
+    return timedelta(seconds=current_app.config.get('IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+
+def _key(header):
+    return hashlib.sha256(f"{request.method}:{request.path}:{header}".encode()).hexdigest()
+
+
+def _fingerprint():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _as_stored(row):
+    return {
+        "fingerprint": row.fingerprint,
+        "status_code": row.status_code,
+        "body": row.body,
+        "mimetype": row.mimetype,
+        "owner": row.owner,
+        "completed": row.completed,
+        "created_at": row.created_at
+    }
+
+
+def _lookup(key):
+    """
+    The stored entry for `key`, or None. An entry with status_code None is a reservation:
+    the first request with that key is still running (possibly in another worker).
+    """
+    cutoff = _now() - _ttl()
+    stored = cache.get(key)
+    if stored is not None and stored["created_at"] > cutoff:
+        return stored
+
+    row = db.session.get(IdempotencyKey, key, populate_existing=True)
+    if row is None:
+        return None
+    if row.created_at < cutoff:
+        # expired but not swept yet, free the key for this request
+        db.session.delete(row)
+        db.session.commit()
+        return None
+    stored = _as_stored(row)
+    if stored["status_code"] is not None:
+        cache.set(key, stored)
+    return stored
+
+
+def _take_over(key, stored):
+    """
+    A reservation older than IDEMPOTENCY_LOCK_SECONDS most likely belongs to a request that
+    died, hand it to this request. If that request is only slow its commit no longer passes
+    the owner check in `_mark_completed` and is rolled back, so its writes never happen twice.
+    Once the view committed the reservation is completed and never taken over.
+    """
+    lock_cutoff = _now() - timedelta(seconds=current_app.config.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+    if stored["completed"] or stored["created_at"] >= lock_cutoff:
+        return None
+    owner = uuid.uuid4().hex
+    taken = IdempotencyKey.query.filter(
+        IdempotencyKey.key == key,
+        IdempotencyKey.owner == stored["owner"],
+        IdempotencyKey.status_code.is_(None),
+        IdempotencyKey.completed.is_(False),
+        IdempotencyKey.created_at < lock_cutoff
+    ).update({"owner": owner, "created_at": _now()}, synchronize_session=False)
+    db.session.commit()
+    return owner if taken else None
+
+
+def _reserve(key, fingerprint):
+    """Insert the placeholder row, its primary key is the lock shared by every worker."""
+    owner = uuid.uuid4().hex
+    db.session.add(IdempotencyKey(key=key, fingerprint=fingerprint, owner=owner, created_at=_now()))
+    try:
+        db.session.commit()
+        return owner
+    except IntegrityError:
+        db.session.rollback()
+        return None
+
+
+@event.listens_for(Session, "before_commit")
+def _mark_completed(session):
+    """Joins the view's commit: marks the reservation completed, or fails the commit if it was taken over."""
+    reservation = g.get("idempotency_reservation") if has_request_context() else None
+    if reservation is None:
+        return
+    key, owner = reservation
+    marked = session.query(IdempotencyKey) \
+        .filter_by(key=key, owner=owner) \
+        .update({"completed": True}, synchronize_session=False)
+    if not marked:
+        raise ReservationLost(key)
+
+
+def _run_view(view, key, owner, *args, **kwargs):
+    g.idempotency_reservation = (key, owner)
+    try:
+        return make_response(view(*args, **kwargs))
+    finally:
+        g.pop("idempotency_reservation", None)
+
+
+def _release(key, owner):
+    """Free the key unless the view already committed, returns whether it was freed."""
+    db.session.rollback()
+    released = IdempotencyKey.query \
+        .filter_by(key=key, owner=owner, completed=False) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return bool(released)
+
+
+def _store(key, owner, response):
+    IdempotencyKey.query.filter_by(key=key, owner=owner).update({
+        "status_code": response.status_code,
+        "body": response.get_data(as_text=True),
+        "mimetype": response.mimetype
+    }, synchronize_session=False)
+    db.session.commit()
+
+    if next(_stores) % current_app.config.get('IDEMPOTENCY_SWEEP_EVERY', 500) == 0:
+        jobs.enqueue("sweep_idempotency_keys")
+
+
+def _replay(stored):
+    response = Response(stored["body"], status=stored["status_code"], mimetype=stored["mimetype"])
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _busy(header):
+    return jsonify({"error": f"A request with {HEADER} {header} is still being processed."}), 409
+
+
+def idempotent(view):
+    """
+    Route decorator, requests without the Idempotency-Key header are not affected.
+    Only responses below 500 are stored so server errors can still be retried, unless the
+    view already committed its writes.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get(HEADER)
+        if not header:
+            return view(*args, **kwargs)
+
+        key = _key(header)
+        fingerprint = _fingerprint()
+
+        for attempt in range(3):
+            stored = _lookup(key)
+            if stored is None:
+                owner = _reserve(key, fingerprint)
+                if owner:
+                    break
+                # lost the race for the key, look again to replay or report the winner
+                continue
+            if stored["fingerprint"] != fingerprint:
+                return jsonify({"error": f"{HEADER} {header} was already used with a different payload."}), 422
+            if stored["status_code"] is not None:
+                return _replay(stored)
+            # completed without a stored response means the view's writes committed, never run it again
+            owner = _take_over(key, stored)
+            if owner:
+                break
+            return _busy(header)
+        else:
+            return _busy(header)
+
+        try:
+            response = _run_view(view, key, owner, *args, **kwargs)
+        except ReservationLost:
+            db.session.rollback()
+            return _busy(header)
+        except Exception:
+            _release(key, owner)
+            raise
+
+        # a server error is released so it can be retried, unless the view committed before failing
+        if response.status_code < 500 or not _release(key, owner):
+            _store(key, owner, response)
+        return response
+
+    return wrapper
+
+
+def sweep(ttl=None):
+    cutoff = _now() - (ttl or _ttl())
+    deleted = IdempotencyKey.query.filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
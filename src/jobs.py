@@ -0,0 +1,219 @@
+"""
+Lightweight job queue for side effects that don't need to block the request
+(audit logging, counters, cache invalidation...).
+
+By default jobs run on an in-process thread pool once the request's transaction
+commits. With JOBS_DURABLE enabled they are written to the `jobs` table inside the
+same transaction instead, and picked up by `flask worker`.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, event, func, or_
+from sqlalchemy.orm import Session
+from models import db, Job
+
+
+class JobQueue:
+
+    def __init__(self, app=None):
+        self.handlers = {}
+        self.executor = None
+        self.durable = False
+        self.max_retries = 3
+        self.backoff = 0.5
+        self.lease = 300
+        self._lock = threading.Lock()
+        self._stats = {"enqueued": 0, "dropped": 0, "in_flight": 0, "completed": 0, "retried": 0, "failed": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.durable = app.config.get('JOBS_DURABLE', False)
+        self.max_retries = app.config.get('JOBS_MAX_RETRIES', 3)
+        self.backoff = app.config.get('JOBS_RETRY_BACKOFF', 0.5)
+        self.lease = app.config.get('JOBS_LEASE_SECONDS', 300)
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('JOBS_MAX_WORKERS', 4),
+            thread_name_prefix='jobs'
+        )
+        event.listen(Session, 'after_commit', self._flush_pending)
+        event.listen(Session, 'after_soft_rollback', self._drop_pending)
+        app.cli.add_command(worker_command)
+        app.extensions['jobs'] = self
+
+    def task(self, name=None):
+        def decorator(fn):
+            self.handlers[name or fn.__name__] = fn
+            return fn
+        return decorator
+
+    def enqueue(self, name, **payload):
+        """
+        Schedule `name` to run with `payload`. When called inside an open transaction
+        the job only runs (or is only persisted) if that transaction commits, it is counted
+        as enqueued then, or as dropped when the transaction (or its savepoint) rolls back.
+        """
+        if name not in self.handlers:
+            raise KeyError(f"No job handler registered for '{name}'")
+
+        session = db.session()
+        in_transaction = session.in_transaction()
+        if not in_transaction and not self.durable:
+            self._count("enqueued")
+            self._submit(name, payload)
+            return
+
+        # remember the savepoint (if any) the job was queued in, rolling it back drops the job
+        session.info.setdefault('pending_jobs', []).append((name, payload, session.get_nested_transaction()))
+        if self.durable:
+            session.add(Job(name=name, payload=payload))
+            if not in_transaction:
+                session.commit()
+
+    def _flush_pending(self, session):
+        for name, payload, savepoint in session.info.pop('pending_jobs', []):
+            self._count("enqueued")
+            if not self.durable:
+                self._submit(name, payload)
+
+    def _drop_pending(self, session, previous_transaction):
+        pending = session.info.pop('pending_jobs', [])
+        if previous_transaction.nested:
+            # only a savepoint rolled back, the outer transaction can still commit its jobs
+            kept = [job for job in pending if not _inside(job[2], previous_transaction)]
+            if kept:
+                session.info['pending_jobs'] = kept
+        else:
+            kept = []
+        self._count("dropped", len(pending) - len(kept))
+
+    def _submit(self, name, payload):
+        self._count("in_flight")
+        self.executor.submit(self._run_in_thread, name, payload)
+
+    def _run_in_thread(self, name, payload):
+        try:
+            with self.app.app_context():
+                for attempt in range(1, self.max_retries + 1):
+                    try:
+                        self.handlers[name](**payload)
+                        self._count("completed")
+                        return
+                    except Exception:
+                        db.session.rollback()
+                        if attempt == self.max_retries:
+                            self._count("failed")
+                            self.app.logger.exception("Job %s failed after %s attempts", name, attempt)
+                            return
+                        self._count("retried")
+                        time.sleep(self.backoff * 2 ** (attempt - 1))
+        finally:
+            self._count("in_flight", -1)
+
+    def run_worker(self, batch_size=10, poll_interval=1.0, once=False):
+        """
+        Drain the durable `jobs` table. Rows are claimed with SELECT ... FOR UPDATE
+        SKIP LOCKED so several workers can run side by side on Postgres.
+        """
+        while True:
+            claimed = self._claim(batch_size)
+            for job in claimed:
+                self._run_durable(job)
+            if once and not claimed:
+                return
+            if not claimed:
+                time.sleep(poll_interval)
+
+    def _claim(self, batch_size):
+        """
+        Claim queued jobs that are due, plus running jobs whose lease expired because their
+        worker died (deploy, OOM...). Claimed jobs are leased for JOBS_LEASE_SECONDS.
+        """
+        now = datetime.now(timezone.utc)
+        candidates = Job.query.filter(or_(
+                and_(Job.status == 'queued', Job.run_at <= now),
+                and_(Job.status == 'running', Job.locked_until < now)
+            )) \
+            .order_by(Job.run_at, Job.id) \
+            .limit(batch_size) \
+            .with_for_update(skip_locked=True) \
+            .all()
+        claimed = []
+        for job in candidates:
+            if job.status == 'running' and job.attempts >= self.max_retries:
+                job.status = 'failed'
+                job.locked_until = None
+                job.last_error = f"lease expired after {job.attempts} attempts"
+                self._count("failed")
+                continue
+            job.status = 'running'
+            job.attempts += 1
+            job.locked_until = now + timedelta(seconds=self.lease)
+            claimed.append(job)
+        db.session.commit()
+        return claimed
+
+    def _run_durable(self, job):
+        try:
+            self.handlers[job.name](**job.payload)
+            job.status = 'done'
+            job.last_error = None
+            self._count("completed")
+        except Exception as error:
+            db.session.rollback()
+            job.last_error = repr(error)
+            if job.attempts >= self.max_retries:
+                job.status = 'failed'
+                self._count("failed")
+            else:
+                job.status = 'queued'
+                job.run_at = datetime.now(timezone.utc) + timedelta(seconds=self.backoff * 2 ** (job.attempts - 1))
+                self._count("retried")
+        job.locked_until = None
+        db.session.commit()
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mode"] = "durable" if self.durable else "memory"
+        stats["depth"] = stats["in_flight"]
+        if self.durable:
+            rows = db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all()
+            stats["by_status"] = {status: count for status, count in rows}
+            # running jobs still count until they finish, a dead worker's job is claimed again
+            stats["depth"] = stats["by_status"].get('queued', 0) + stats["by_status"].get('running', 0)
+            stats["expired_leases"] = Job.query.filter(
+                Job.status == 'running', Job.locked_until < datetime.now(timezone.utc)
+            ).count()
+        return stats
+
+
+def _inside(transaction, savepoint):
+    while transaction is not None:
+        if transaction is savepoint:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+jobs = JobQueue()
+
+
+@click.command('worker')
+@click.option('--batch-size', default=10, help='Jobs claimed per round trip.')
+@click.option('--poll-interval', default=1.0, help='Seconds to sleep when the queue is empty.')
+@click.option('--once', is_flag=True, help='Exit once the queue is drained.')
+@with_appcontext
+def worker_command(batch_size, poll_interval, once):
+    """Process jobs from the durable job table."""
+    jobs.run_worker(batch_size=batch_size, poll_interval=poll_interval, once=once)
@@ -2,11 +2,17 @@ from datetime import timezone, datetime
 from flask_sqlalchemy import SQLAlchemy
 from collections import OrderedDict
 
-db = SQLAlchemy()
+# objects are serialized after the commit, don't make every attribute access reload them
+db = SQLAlchemy(session_options={"expire_on_commit": False})
 
 
 class User(db.Model):
     __tablename__ = 'users' 
+    # LIKE 'prefix%' indexes for the admin search, the unique indexes only serve it under the C collation
+    __table_args__ = (
+        db.Index('ix_users_username_pattern', 'username', postgresql_ops={'username': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_users_email_pattern', 'email', postgresql_ops={'email': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
@@ -34,6 +40,9 @@ class User(db.Model):
     
 class Planet(db.Model):
     __tablename__ = 'planets'
+    __table_args__ = (
+        db.Index('ix_planets_name_pattern', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
@@ -42,14 +51,22 @@ class Planet(db.Model):
     characters = db.relationship("Character", back_populates="planet")
     favorites = db.relationship("Favorite", back_populates="planet")
 
-    def serialize(self):
-        return {
+    def serialize(self, resident_count=None):
+        """
+        Embeds the residents, when serializing many planets load them in one query first
+        (see serialize_planets in app.py). Passing resident_count (from a grouped count) replaces the list with it.
+        """
+        data = {
             "id": self.id,
             "name": self.name,
             "description": self.description,
-            "image_url": self.image_url,
-            "people": self.characters
+            "image_url": self.image_url
         }
+        if resident_count is None:
+            data["people"] = [character.serialize_slim() for character in self.characters]
+        else:
+            data["resident_count"] = resident_count
+        return data
     
     def serialize_slim(self):
         return {   
@@ -59,12 +76,15 @@ class Planet(db.Model):
 
 class Character(db.Model):
     __tablename__ = 'characters'
+    __table_args__ = (
+        db.Index('ix_characters_name_pattern', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text)
     image_url = db.Column(db.String(255))
-    planet_id = db.Column(db.Integer, db.db.ForeignKey('planets.id'))
+    planet_id = db.Column(db.Integer, db.db.ForeignKey('planets.id'), index=True)
 
     planet = db.relationship("Planet", back_populates="characters")
     favorites = db.relationship("Favorite", back_populates="character")
@@ -88,7 +108,7 @@ class Favorite(db.Model):
     __tablename__ = 'favorites'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'))
     character_id = db.Column(db.Integer, db.ForeignKey('characters.id'))
 
@@ -103,8 +123,8 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     user = db.relationship("User", back_populates="posts")  
@@ -125,4 +145,51 @@ class Post(db.Model):
             "title": self.title,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }  
\ No newline at end of file
+        }  
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        db.Index('ix_jobs_status_locked_until', 'status', 'locked_until'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    run_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    # lease of the worker running the job, once it passes the job is claimed again
+    locked_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "run_at": self.run_at.isoformat() if self.run_at else None,
+            "locked_until": self.locked_until.isoformat() if self.locked_until else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # both stay NULL while the first request holding the key is still running
+    status_code = db.Column(db.Integer)
+    body = db.Column(db.Text)
+    mimetype = db.Column(db.String(100))
+    # random token of the request holding the key, its commit only goes through while it still owns the row
+    owner = db.Column(db.String(32))
+    # set in the same transaction as the request's writes, the response is stored right after
+    completed = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True, default=lambda: datetime.now(timezone.utc))
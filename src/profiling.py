@@ -0,0 +1,235 @@
+"""
+Opt-in request profiling.
+
+A request is profiled when it carries the `X-Profile` header with the PROFILING_TOKEN, or
+randomly according to PROFILING_SAMPLE_RATE. PROFILING_MODE picks cProfile ("cprofile",
+exact but slower) or a stack sampling thread ("sampling", low overhead). The SQL issued
+by the request is captured too, and the last PROFILING_KEEP profiles are served at
+/api/profiles (same token required).
+"""
+import cProfile
+import hmac
+import io
+import itertools
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from flask import Blueprint, Response, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+HEADER = "X-Profile"
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of another thread every `interval` seconds."""
+
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(daemon=True, name="profiler-sampler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+
+    def __init__(self, app=None):
+        self.profiles = deque(maxlen=20)
+        self._ids = itertools.count(1)
+        # cProfile can only have one active profiler at a time on newer pythons
+        self._cprofile_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.profiles = deque(maxlen=app.config.get('PROFILING_KEEP', 20))
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._cleanup)
+        event.listen(Engine, "before_cursor_execute", self._before_sql)
+        event.listen(Engine, "after_cursor_execute", self._after_sql)
+        app.register_blueprint(profiles_bp)
+        app.extensions['profiler'] = self
+
+    def authorized(self):
+        token = current_app.config.get('PROFILING_TOKEN')
+        given = request.headers.get(HEADER)
+        # constant time so the token can't be guessed from response timings
+        return bool(token) and given is not None and hmac.compare_digest(given.encode(), token.encode())
+
+    def _wanted(self):
+        if request.blueprint == profiles_bp.name:
+            return False
+        rate = current_app.config.get('PROFILING_SAMPLE_RATE', 0.0)
+        return self.authorized() or (rate > 0 and random.random() < rate)
+
+    def _start(self):
+        if not self._wanted():
+            return
+        mode = current_app.config.get('PROFILING_MODE', 'cprofile')
+        g.profile = {"mode": mode, "sql": [], "started": time.perf_counter()}
+
+        if mode == "sampling":
+            sampler = StackSampler(threading.get_ident(), current_app.config.get('PROFILING_INTERVAL', 0.005))
+            sampler.start()
+            g.profile["sampler"] = sampler
+        elif self._cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+            g.profile["cprofile"] = profiler
+        else:
+            g.pop("profile")
+
+    def _stop(self, profile):
+        if "cprofile" in profile:
+            profile["cprofile"].disable()
+            self._cprofile_lock.release()
+        if "sampler" in profile:
+            profile["sampler"].stop()
+
+    def _finish(self, response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        self._stop(profile)
+
+        entry = {
+            "id": next(self._ids),
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "status": response.status_code,
+            "mode": profile["mode"],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round((time.perf_counter() - profile["started"]) * 1000, 3),
+            "sql": profile["sql"]
+        }
+        if "cprofile" in profile:
+            entry["stats"] = pstats.Stats(profile["cprofile"])
+        else:
+            entry["samples"] = profile["sampler"].samples
+        self.profiles.append(entry)
+        response.headers["X-Profile-Id"] = str(entry["id"])
+        return response
+
+    def _cleanup(self, error=None):
+        # after_request doesn't run when the view raised, don't leave a profiler running
+        profile = g.pop("profile", None)
+        if profile is not None:
+            self._stop(profile)
+
+    def _before_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and "profile" in g:
+            conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+    def _after_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and "profile" in g and conn.info.get("profile_query_start"):
+            started = conn.info["profile_query_start"].pop()
+            g.profile["sql"].append({
+                "statement": statement,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3)
+            })
+
+    def get(self, profile_id):
+        for entry in self.profiles:
+            if entry["id"] == profile_id:
+                return entry
+        return None
+
+
+def summary(entry):
+    return {
+        "id": entry["id"],
+        "method": entry["method"],
+        "path": entry["path"],
+        "status": entry["status"],
+        "mode": entry["mode"],
+        "created_at": entry["created_at"],
+        "duration_ms": entry["duration_ms"],
+        "queries": len(entry["sql"])
+    }
+
+
+def collapsed(entry):
+    """Collapsed stack lines (`frame;frame;frame count`) for flamegraph.pl / speedscope."""
+    if "samples" in entry:
+        samples = entry["samples"]
+    else:
+        # cProfile only knows caller -> callee pairs, emit those as two frame stacks weighted by
+        # the microseconds spent in the callee itself when called from that caller. Cumulative
+        # time would count every frame once per ancestor, self time adds up to the request
+        samples = Counter()
+        for func, (cc, nc, tt, ct, callers) in entry["stats"].stats.items():
+            label = pstats.func_std_string(func)
+            for caller, caller_stats in callers.items():
+                samples[f"{pstats.func_std_string(caller)};{label}"] += int(caller_stats[2] * 1e6)
+            if not callers:
+                samples[label] += int(tt * 1e6)
+    return "".join(f"{stack} {count}\n" for stack, count in samples.items() if count)
+
+
+profiler = Profiler()
+profiles_bp = Blueprint('profiles', __name__, url_prefix='/api/profiles')
+
+
+@profiles_bp.before_request
+def require_token():
+    if not profiler.authorized():
+        return jsonify({"error": "not found"}), 404
+
+
+@profiles_bp.route('', methods=["GET"])
+def list_profiles():
+    return jsonify(profiles=[summary(entry) for entry in reversed(profiler.profiles)]), 200
+
+
+@profiles_bp.route('/<int:profile_id>', methods=["GET"])
+def get_profile(profile_id):
+    """
+    ?format=text (default) pstats report, pstats (binary, for snakeviz / pstats.Stats),
+    collapsed (flamegraphs) or sql.
+    """
+    entry = profiler.get(profile_id)
+    if entry is None:
+        return jsonify({"error": f"profile {profile_id} does not exist"}), 404
+
+    fmt = request.args.get("format", "text")
+    if fmt == "sql":
+        return jsonify(summary(entry) | {"sql": entry["sql"]}), 200
+    if fmt == "collapsed":
+        return Response(collapsed(entry), mimetype="text/plain")
+    if "stats" not in entry:
+        return jsonify({"error": f"profile {profile_id} was sampled, only format=collapsed or sql is available"}), 400
+    if fmt == "pstats":
+        return Response(
+            marshal.dumps(entry["stats"].stats),
+            mimetype="application/octet-stream",
+            headers={"Content-Disposition": f"attachment; filename=profile-{profile_id}.prof"}
+        )
+
+    out = io.StringIO()
+    stats = pstats.Stats(stream=out)
+    stats.add(entry["stats"])
+    stats.sort_stats("cumulative").print_stats(50)
+    return Response(out.getvalue(), mimetype="text/plain")
@@ -0,0 +1,140 @@
+"""
+`flask seed` fills the database with deterministic synthetic data so the endpoints can be
+profiled against realistic cardinalities. The same --seed always generates the same rows.
+"""
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from models import db, User, Planet, Character, Favorite, Post
+
+BASE_DATE = datetime(2024, 1, 1)
+
+
+def _next_id(conn, model):
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _timestamp(value):
+    # same text the ORM writes for a DateTime on SQLite, so seeded rows compare and sort
+    # exactly like rows created through the API (Postgres parses it just the same)
+    return value.isoformat(sep=' ', timespec='microseconds')
+
+
+def _insert_sql(conn, model, columns):
+    # rows go straight to the driver's executemany as tuples, having SQLAlchemy build a
+    # parameter dict per row cost more than the inserts themselves
+    quote = conn.dialect.identifier_preparer.quote
+    placeholder = "?" if conn.dialect.paramstyle == "qmark" else "%s"
+    return f"INSERT INTO {quote(model.__tablename__)} ({', '.join(quote(column) for column in columns)}) " \
+           f"VALUES ({', '.join([placeholder] * len(columns))})"
+
+
+def _insert(conn, model, columns, rows, batch_size):
+    sql = _insert_sql(conn, model, columns)
+    count = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return count
+        conn.exec_driver_sql(sql, batch)
+        count += len(batch)
+
+
+def _skewed(rng, first_id, count, skew):
+    # skew > 1 piles most rows onto the first few ids, like a few crowded planets
+    return first_id + int(count * rng.random() ** skew)
+
+
+def seed(users=1000, planets=100, characters=5000, favorites=10000, posts=20000,
+         seed=42, skew=3.0, batch_size=10000, echo=print):
+    rng = random.Random(seed)
+
+    with db.engine.begin() as conn:
+        user_id = _next_id(conn, User)
+        planet_id = _next_id(conn, Planet)
+        character_id = _next_id(conn, Character)
+
+        def user_rows():
+            for i in range(user_id, user_id + users):
+                yield (i, f"user{i}", f"user{i}@example.com", "seeded",
+                       _timestamp(BASE_DATE + timedelta(minutes=i)), rng.random() > 0.1)
+
+        def planet_rows():
+            for i in range(planet_id, planet_id + planets):
+                yield (i, f"Planet {i}", f"Synthetic planet number {i}.", f"https://example.com/planets/{i}.jpg")
+
+        def character_rows():
+            for i in range(character_id, character_id + characters):
+                yield (i, f"Character {i}", f"Synthetic character number {i}.", f"https://example.com/people/{i}.jpg",
+                       _skewed(rng, planet_id, planets, skew) if planets else None)
+
+        def favorite_rows():
+            # planet and character favorites each walk their own (user, target) pairs, so no
+            # user favorites the same planet or character twice
+            planet_favorites = min(favorites // 2 if characters else favorites, users * planets)
+            character_favorites = min(favorites - planet_favorites, users * characters)
+            for j in range(planet_favorites):
+                yield (user_id + j % users, planet_id + j // users, None)
+            for j in range(character_favorites):
+                yield (user_id + j % users, None, character_id + j // users)
+
+        def post_rows():
+            # the hot loop of a large seed, _skewed is inlined
+            contents = ["Synthetic post body. " * n for n in range(1, 21)]
+            random = rng.random
+            created_at = BASE_DATE
+            step = timedelta(seconds=37)
+            for i in range(posts):
+                timestamp = _timestamp(created_at)
+                content = contents[int(random() * len(contents))]
+                yield (f"Post {i}", content, user_id + int(users * random() ** skew), timestamp, timestamp)
+                created_at += step
+
+        steps = [
+            (User, ("id", "username", "email", "password", "created_at", "is_active"), user_rows, True),
+            (Planet, ("id", "name", "description", "image_url"), planet_rows, True),
+            (Character, ("id", "name", "description", "image_url", "planet_id"), character_rows, True),
+            (Favorite, ("user_id", "planet_id", "character_id"), favorite_rows,
+             users > 0 and (planets > 0 or characters > 0)),
+            (Post, ("title", "content", "user_id", "created_at", "updated_at"), post_rows, users > 0)
+        ]
+        for model, columns, rows, enabled in steps:
+            if not enabled:
+                continue
+            started = time.perf_counter()
+            count = _insert(conn, model, columns, rows(), batch_size)
+            elapsed = time.perf_counter() - started
+            echo(f"seeded {model.__tablename__}: {count} rows in {elapsed:.2f}s")
+
+
+@click.command('seed')
+@click.option('--users', default=1000, help='Number of users.')
+@click.option('--planets', default=100, help='Number of planets.')
+@click.option('--characters', default=5000, help='Number of characters.')
+@click.option('--favorites', default=10000, help='Number of favorites.')
+@click.option('--posts', default=20000, help='Number of posts.')
+@click.option('--scale', default=1.0, help='Multiplies every count above.')
+@click.option('--seed', 'seed_value', default=42, help='Random seed, same seed same data.')
+@click.option('--skew', default=3.0, help='How unevenly characters/posts spread over planets/users, 1 is uniform.')
+@click.option('--batch-size', default=10000, help='Rows per insert.')
+@with_appcontext
+def seed_command(users, planets, characters, favorites, posts, scale, seed_value, skew, batch_size):
+    """Generate synthetic users, planets, characters, favorites and posts."""
+    started = time.perf_counter()
+    seed(
+        users=int(users * scale),
+        planets=int(planets * scale),
+        characters=int(characters * scale),
+        favorites=int(favorites * scale),
+        posts=int(posts * scale),
+        seed=seed_value,
+        skew=skew,
+        batch_size=batch_size,
+        echo=click.echo
+    )
+    click.echo(f"done in {time.perf_counter() - started:.2f}s")
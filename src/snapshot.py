@@ -0,0 +1,248 @@
+"""
+`flask snapshot export/import` to back up or clone the whole database.
+
+A snapshot is a directory with a manifest.json plus one file per table: Parquet when
+pyarrow is installed, gzip compressed NDJSON otherwise. Rows are read with a server side
+cursor, written in chunks and restored with bulk inserts in foreign key order, keeping ids.
+"""
+import gzip
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select, text
+from models import db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+SNAPSHOT_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def _is_datetime(column):
+    return isinstance(column.type, db.DateTime)
+
+
+def _is_json(column):
+    return isinstance(column.type, db.JSON)
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _encoders(columns, fmt):
+    # worked out once per table, checking the column types for every value dominated export time
+    encoders = []
+    for column in columns:
+        if _is_json(column):
+            encoders.append(json.dumps)
+        elif _is_datetime(column) and fmt == "ndjson":
+            encoders.append(datetime.isoformat)
+        else:
+            encoders.append(None)
+    return encoders
+
+
+def _decoders(columns):
+    decoders = []
+    for column in columns:
+        if _is_json(column):
+            decoders.append(json.loads)
+        elif _is_datetime(column):
+            decoders.append(_parse_datetime)
+        else:
+            decoders.append(None)
+    return decoders
+
+
+def _encode(encoders, row):
+    return [value if encoder is None or value is None else encoder(value) for encoder, value in zip(encoders, row)]
+
+
+def _decode(names, decoders, values):
+    return {
+        name: value if decoder is None or value is None else decoder(value)
+        for name, decoder, value in zip(names, decoders, values)
+    }
+
+
+def _arrow_type(column):
+    if isinstance(column.type, db.Boolean):
+        return pa.bool_()
+    if isinstance(column.type, db.Integer):
+        return pa.int64()
+    if _is_datetime(column):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def _table_file(table, fmt):
+    return f"{table.name}.parquet" if fmt == "parquet" else f"{table.name}.ndjson.gz"
+
+
+@contextmanager
+def _consistent_transaction():
+    """
+    Every table has to be read from the same point in time, otherwise a row written during
+    the export can reference a parent exported before it existed. On Postgres the export runs
+    in one SERIALIZABLE READ ONLY DEFERRABLE transaction (waits for a safe snapshot, never
+    aborts), on MySQL in one REPEATABLE READ transaction. pysqlite never sends BEGIN before a
+    SELECT, so on SQLite it is sent explicitly: in WAL mode writers carry on and the export
+    keeps its snapshot, with the default rollback journal they wait for the export to finish.
+    """
+    with db.engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn = conn.execution_options(
+                isolation_level="SERIALIZABLE", postgresql_readonly=True, postgresql_deferrable=True
+            )
+        elif conn.dialect.name == "mysql":
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            if conn.dialect.name == "sqlite":
+                conn.exec_driver_sql("BEGIN")
+            yield conn
+
+
+def export_snapshot(path, fmt=None, chunk_size=10000, echo=print):
+    fmt = fmt or ("parquet" if pa is not None else "ndjson")
+    if fmt == "parquet" and pa is None:
+        raise click.ClickException("pyarrow is not installed, use --format ndjson")
+
+    os.makedirs(path, exist_ok=True)
+    manifest = {"version": SNAPSHOT_VERSION, "format": fmt, "tables": []}
+
+    with _consistent_transaction() as conn:
+        streaming = conn.execution_options(yield_per=chunk_size)
+        for table in db.metadata.sorted_tables:
+            columns = list(table.columns)
+            started = time.perf_counter()
+            result = streaming.execute(select(table).order_by(*table.primary_key.columns))
+            rows = _write_table(os.path.join(path, _table_file(table, fmt)), fmt, columns, result.partitions())
+            elapsed = time.perf_counter() - started
+            manifest["tables"].append({
+                "name": table.name,
+                "columns": [column.name for column in columns],
+                "rows": rows
+            })
+            echo(f"exported {table.name}: {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _write_table(filename, fmt, columns, chunks):
+    rows = 0
+    encoders = _encoders(columns, fmt)
+    if fmt == "parquet":
+        schema = pa.schema([(column.name, _arrow_type(column)) for column in columns])
+        with pq.ParquetWriter(filename, schema, compression="zstd") as writer:
+            for chunk in chunks:
+                encoded = [_encode(encoders, row) for row in chunk]
+                arrays = [pa.array([row[i] for row in encoded], type=field.type) for i, field in enumerate(schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                rows += len(chunk)
+        return rows
+
+    with gzip.open(filename, "wt", encoding="utf-8", compresslevel=6) as f:
+        dumps = json.JSONEncoder(separators=(",", ":")).encode
+        for chunk in chunks:
+            f.write("".join(dumps(_encode(encoders, row)) + "\n" for row in chunk))
+            rows += len(chunk)
+    return rows
+
+
+def _read_table(filename, fmt, chunk_size):
+    if fmt == "parquet":
+        for batch in pq.ParquetFile(filename).iter_batches(batch_size=chunk_size):
+            columns = batch.to_pydict()
+            yield list(zip(*columns.values()))
+        return
+
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        chunk = []
+        for line in f:
+            chunk.append(json.loads(line))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def import_snapshot(path, chunk_size=10000, truncate=False, echo=print):
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    fmt = manifest["format"]
+    if fmt == "parquet" and pa is None:
+        raise click.ClickException("This snapshot is in parquet format and pyarrow is not installed")
+
+    tables = {table.name: table for table in db.metadata.sorted_tables}
+    entries = {entry["name"]: entry for entry in manifest["tables"]}
+
+    with db.engine.begin() as conn:
+        if truncate:
+            for table in reversed(db.metadata.sorted_tables):
+                conn.execute(table.delete())
+
+        # sorted_tables puts parents before children so FKs are satisfied on insert
+        for table in db.metadata.sorted_tables:
+            entry = entries.get(table.name)
+            if entry is None:
+                continue
+            names = entry["columns"]
+            decoders = _decoders([table.columns[name] for name in names])
+            started = time.perf_counter()
+            rows = 0
+            for chunk in _read_table(os.path.join(path, _table_file(table, fmt)), fmt, chunk_size):
+                conn.execute(table.insert(), [_decode(names, decoders, values) for values in chunk])
+                rows += len(chunk)
+            elapsed = time.perf_counter() - started
+            echo(f"imported {table.name}: {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+
+        if conn.dialect.name == "postgresql":
+            _reset_sequences(conn, [tables[name] for name in entries if name in tables])
+
+
+def _reset_sequences(conn, tables):
+    # ids were inserted explicitly, move the serial sequences past them
+    for table in tables:
+        for column in table.primary_key.columns:
+            if not isinstance(column.type, db.Integer):
+                continue
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', '{column.name}'), "
+                f"COALESCE((SELECT MAX({column.name}) FROM {table.name}), 0) + 1, false)"
+            ))
+
+
+snapshot_cli = AppGroup('snapshot', help='Export or import a snapshot of the whole database.')
+
+
+@snapshot_cli.command('export')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['parquet', 'ndjson']), default=None,
+              help='Defaults to parquet when pyarrow is installed.')
+@click.option('--chunk-size', default=10000, help='Rows fetched and written per chunk.')
+def export_command(path, fmt, chunk_size):
+    """Write every table to the snapshot directory PATH."""
+    export_snapshot(path, fmt=fmt, chunk_size=chunk_size, echo=click.echo)
+
+
+@snapshot_cli.command('import')
+@click.argument('path')
+@click.option('--chunk-size', default=10000, help='Rows per bulk insert.')
+@click.option('--truncate', is_flag=True, help='Delete existing rows before importing.')
+def import_command(path, chunk_size, truncate):
+    """Restore the snapshot directory PATH into the database."""
+    import_snapshot(path, chunk_size=chunk_size, truncate=truncate, echo=click.echo)
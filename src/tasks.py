@@ -0,0 +1,18 @@
+"""
+Side effects run through the job queue, see jobs.py.
+Use `jobs.enqueue("<task name>", **payload)` from the routes, payloads must be JSON serializable.
+"""
+from flask import current_app
+from jobs import jobs
+import idempotency
+
+
+@jobs.task("audit_log")
+def audit_log(action, model, object_id=None, **details):
+    current_app.logger.info("audit: %s %s id=%s %s", action, model, object_id, details)
+
+
+@jobs.task("sweep_idempotency_keys")
+def sweep_idempotency_keys():
+    deleted = idempotency.sweep()
+    current_app.logger.info("swept %s expired idempotency keys", deleted)
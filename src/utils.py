@@ -1,4 +1,9 @@
 from flask import jsonify, url_for
+from sqlalchemy import inspect, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+from models import db
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +20,35 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def create(model, **values):
+    """
+    Insert a new row and return it as a model instance, or None if it clashes with a unique
+    constraint. On Postgres and SQLite this is a single INSERT ... ON CONFLICT DO NOTHING
+    RETURNING round trip: no uniqueness SELECT before it and no refresh after the commit.
+    """
+    session = db.session()
+    dialect = session.get_bind().dialect
+
+    if dialect.name in ("postgresql", "sqlite") and dialect.insert_returning:
+        dialect_insert = postgresql.insert if dialect.name == "postgresql" else sqlite.insert
+        stmt = dialect_insert(model).values(**values).on_conflict_do_nothing().returning(model)
+        obj = session.scalars(stmt).first()
+    else:
+        obj = model(**values)
+        try:
+            with session.begin_nested():
+                session.add(obj)
+        except IntegrityError:
+            return None
+
+    if obj is not None:
+        # a row that was just inserted can't have children yet, mark its collections as
+        # loaded so serializing it doesn't run a SELECT per relationship
+        for relationship in inspect(model).relationships:
+            if relationship.uselist:
+                set_committed_value(obj, relationship.key, [])
+    return obj
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app import app as flask_app  # noqa: E402
+from models import db  # noqa: E402
+import idempotency  # noqa: E402
+
+
+def quiet(message):
+    """`echo` for seed/snapshot calls in tests, `from conftest import quiet`."""
+
+
+@pytest.fixture
+def app():
+    """
+    The app with fresh tables. No app context is left pushed: like in production every
+    client request gets its own context and session, wrap direct database access in
+    `with app.app_context():`.
+    """
+    flask_app.config["TESTING"] = True
+    with flask_app.app_context():
+        db.create_all()
+    yield flask_app
+    with flask_app.app_context():
+        db.drop_all()
+    idempotency.cache.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def queries(app):
+    """List of the SQL statements run while the test is executing, call .clear() before the part you measure."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
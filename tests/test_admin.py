@@ -0,0 +1,59 @@
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from admin import _prefix_match
+from conftest import quiet
+from models import db, User
+from seed import seed
+
+
+def test_search_is_a_prefix_match(app, client):
+    with app.app_context():
+        seed(users=30, planets=0, characters=0, favorites=0, posts=0, echo=quiet)
+
+    response = client.get('/admin/user/?search=user2')
+
+    assert response.status_code == 200
+    page = response.data.decode()
+    assert 'user2@example.com' in page
+    assert 'user21@example.com' in page
+    assert 'user12@example.com' not in page
+
+
+def test_search_uses_the_column_index(app, client, queries):
+    with app.app_context():
+        seed(users=30, planets=0, characters=0, favorites=0, posts=0, echo=quiet)
+
+    queries.clear()
+    client.get('/admin/user/?search=user2')
+
+    searches = [statement for statement in queries if "users.username >=" in statement]
+    assert searches
+    assert all("LIKE" not in statement.upper() for statement in searches)
+
+    with app.app_context():
+        plan = db.session.execute(
+            text("EXPLAIN QUERY PLAN SELECT id FROM users WHERE username >= :term AND username < :end"),
+            {"term": "user2", "end": "user2\U0010ffff"}
+        ).all()
+    assert any("INDEX" in str(row) for row in plan)
+
+
+def test_page_size_is_capped(app, client):
+    with app.app_context():
+        seed(users=150, planets=0, characters=0, favorites=0, posts=0, echo=quiet)
+
+    oversized = client.get('/admin/user/?page_size=100000').data.decode()
+    negative = client.get('/admin/user/?page_size=-1').data.decode()
+
+    assert oversized.count('@example.com') == 100
+    # falls back to the default page size
+    assert negative.count('@example.com') == 25
+
+
+def test_search_is_a_like_prefix_outside_sqlite():
+    clause = _prefix_match(User.username, "50%_off", "postgresql")
+
+    compiled = clause.compile(dialect=postgresql.dialect())
+    assert "LIKE" in str(compiled) and ">=" not in str(compiled)
+    assert list(compiled.params.values()) == ["50\\%\\_off%"]
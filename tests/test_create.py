@@ -0,0 +1,87 @@
+from models import db, Planet, User
+from utils import create
+
+USER = {"username": "leia", "email": "leia@alderaan.com", "password": "organa"}
+PLANET = {"name": "Alderaan", "description": "peaceful", "image_url": "url"}
+
+
+def test_create_user_is_one_statement(client, queries):
+    queries.clear()
+    response = client.post('/api/users', json=USER)
+
+    assert response.status_code == 201
+    assert response.json["username"] == "leia"
+    assert response.json["posts"] == []
+    assert len(queries) == 1
+    assert queries[0].startswith("INSERT")
+
+
+def test_create_planet_is_one_statement(client, queries):
+    queries.clear()
+    response = client.post('/api/planets', json=PLANET)
+
+    assert response.status_code == 201
+    assert response.json["people"] == []
+    assert len(queries) == 1
+
+
+def test_create_person_checks_the_planet_then_inserts(client, queries):
+    client.post('/api/planets', json=PLANET)
+
+    queries.clear()
+    response = client.post('/api/people', json={"name": "Bail", "description": "senator", "image_url": "url", "planet_id": 1})
+
+    assert response.status_code == 201
+    assert response.json["planet_id"] == 1
+    assert len(queries) == 2
+
+
+def test_create_post_doesnt_load_posts_before_insert(client, queries):
+    client.post('/api/users', json=USER)
+    client.post('/api/posts/1', json={"title": "first", "content": "c"})
+
+    queries.clear()
+    response = client.post('/api/posts/1', json={"title": "second", "content": "c"})
+
+    assert response.status_code == 201
+    assert [post["title"] for post in response.json["user"]["posts"]] == ["first", "second"]
+    # user lookup, insert, posts listed in the response
+    assert len(queries) == 3
+
+
+def test_create_returns_none_on_conflict(app):
+    with app.app_context():
+        assert create(Planet, **PLANET) is not None
+        db.session.commit()
+
+        assert create(Planet, **PLANET) is None
+        assert Planet.query.count() == 1
+
+
+def test_duplicate_username(client):
+    client.post('/api/users', json=USER)
+    response = client.post('/api/users', json=dict(USER, email="other@alderaan.com"))
+
+    assert response.status_code == 400
+    assert response.json == {"error": "Username leia alerady exists."}
+
+
+def test_duplicate_email(app, client):
+    client.post('/api/users', json=USER)
+    response = client.post('/api/users', json=dict(USER, username="other"))
+
+    assert response.status_code == 400
+    assert response.json == {"error": "Email leia@alderaan.com alerady exists."}
+    with app.app_context():
+        assert User.query.count() == 1
+
+
+def test_duplicate_planet_and_person(client):
+    client.post('/api/planets', json=PLANET)
+    person = {"name": "Bail", "description": "senator", "image_url": "url", "planet_id": 1}
+    client.post('/api/people', json=person)
+
+    assert client.post('/api/planets', json=PLANET).status_code == 400
+    response = client.post('/api/people', json=person)
+    assert response.status_code == 400
+    assert response.json == {"error": "Name Bail alerady exists."}
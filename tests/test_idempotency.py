@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event, text
+
+import idempotency
+from models import db, Post, IdempotencyKey
+
+HEADERS = {"Idempotency-Key": "retry-1"}
+
+
+def create_user(client):
+    client.post('/api/users', json={"username": "han", "email": "han@falcon.com", "password": "chewie"})
+
+
+def test_replays_the_stored_response(app, client):
+    create_user(client)
+    first = client.post('/api/posts/1', json={"title": "t", "content": "c"}, headers=HEADERS)
+    second = client.post('/api/posts/1', json={"title": "t", "content": "c"}, headers=HEADERS)
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.json == first.json
+    with app.app_context():
+        assert Post.query.count() == 1
+
+
+def test_different_payload_is_rejected(app, client):
+    create_user(client)
+    client.post('/api/posts/1', json={"title": "t", "content": "c"}, headers=HEADERS)
+    response = client.post('/api/posts/1', json={"title": "other", "content": "c"}, headers=HEADERS)
+
+    assert response.status_code == 422
+    with app.app_context():
+        assert Post.query.count() == 1
+
+
+def test_key_reserved_by_another_worker_returns_409(client, app):
+    create_user(client)
+    with app.test_request_context('/api/posts/1', method="POST", json={"title": "t", "content": "c"}):
+        key = idempotency._key("retry-1")
+        fingerprint = idempotency._fingerprint()
+        # what another worker leaves behind while its request is still running
+        db.session.add(IdempotencyKey(key=key, fingerprint=fingerprint, created_at=idempotency._now()))
+        db.session.commit()
+
+    response = client.post('/api/posts/1', json={"title": "t", "content": "c"}, headers=HEADERS)
+
+    assert response.status_code == 409
+    with app.app_context():
+        assert Post.query.count() == 0
+
+
+def test_abandoned_reservation_is_taken_over(client, app):
+    create_user(client)
+    with app.test_request_context('/api/posts/1', method="POST", json={"title": "t", "content": "c"}):
+        key = idempotency._key("retry-1")
+        fingerprint = idempotency._fingerprint()
+        # left behind by a worker that died mid request
+        stale = idempotency._now() - timedelta(minutes=5)
+        db.session.add(IdempotencyKey(key=key, fingerprint=fingerprint, owner="dead", created_at=stale))
+        db.session.commit()
+
+    response = client.post('/api/posts/1', json={"title": "t", "content": "c"}, headers=HEADERS)
+
+    assert response.status_code == 201
+    with app.app_context():
+        assert Post.query.count() == 1
+
+
+def test_slow_request_taken_over_doesnt_write(client, app):
+    create_user(client)
+    with app.app_context():
+        engine = db.engine
+    taken_over = []
+
+    def take_over(conn, cursor, statement, parameters, context, executemany):
+        # the request is slow enough that another worker takes the key over before it inserts
+        if statement.startswith("INSERT INTO posts") and not taken_over:
+            taken_over.append(True)
+            with engine.begin() as other:
+                other.execute(text("UPDATE idempotency_keys SET owner = 'other-worker'"))
+
+    event.listen(engine, "before_cursor_execute", take_over)
+    try:
+        response = client.post('/api/posts/1', json={"title": "t", "content": "c"}, headers=HEADERS)
+    finally:
+        event.remove(engine, "before_cursor_execute", take_over)
+
+    assert response.status_code == 409
+    with app.app_context():
+        assert Post.query.count() == 0
+        row = IdempotencyKey.query.one()
+        assert row.owner == "other-worker"
+        assert row.completed is False
+        assert row.status_code is None
+
+
+def test_crash_after_commit_is_never_run_again(client, app, monkeypatch):
+    create_user(client)
+
+    def crash(key, owner, response):
+        raise RuntimeError("worker died before storing the response")
+
+    monkeypatch.setattr(idempotency, "_store", crash)
+    with pytest.raises(RuntimeError):
+        client.post('/api/posts/1', json={"title": "t", "content": "c"}, headers=HEADERS)
+    monkeypatch.undo()
+
+    with app.app_context():
+        row = IdempotencyKey.query.one()
+        assert row.completed is True
+        row.created_at = idempotency._now() - timedelta(minutes=5)
+        db.session.commit()
+
+    response = client.post('/api/posts/1', json={"title": "t", "content": "c"}, headers=HEADERS)
+
+    assert response.status_code == 409
+    with app.app_context():
+        assert Post.query.count() == 1
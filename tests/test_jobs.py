@@ -0,0 +1,154 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from jobs import jobs
+from models import db, Job, Planet
+
+
+def expired_running_job(attempts):
+    job = Job(
+        name="audit_log",
+        payload={"action": "create", "model": "User", "object_id": 1},
+        status="running",
+        attempts=attempts,
+        locked_until=datetime.now(timezone.utc) - timedelta(minutes=1)
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def test_expired_lease_is_claimed_again(app):
+    with app.app_context():
+        job = expired_running_job(attempts=1)
+
+        jobs.run_worker(once=True)
+
+        db.session.refresh(job)
+        assert job.status == "done"
+        assert job.attempts == 2
+        assert job.locked_until is None
+
+
+def test_expired_lease_counts_against_max_retries(app):
+    with app.app_context():
+        job = expired_running_job(attempts=jobs.max_retries)
+
+        jobs.run_worker(once=True)
+
+        db.session.refresh(job)
+        assert job.status == "failed"
+        assert "lease expired" in job.last_error
+
+
+def test_running_job_with_live_lease_is_left_alone(app):
+    with app.app_context():
+        job = expired_running_job(attempts=1)
+        job.locked_until = datetime.now(timezone.utc) + timedelta(minutes=5)
+        db.session.commit()
+
+        jobs.run_worker(once=True)
+
+        db.session.refresh(job)
+        assert job.status == "running"
+        assert job.attempts == 1
+
+
+calls = []
+
+
+@jobs.task("record")
+def record(value, fail_times=0):
+    calls.append(value)
+    if calls.count(value) <= fail_times:
+        raise RuntimeError("try again")
+
+
+def wait_for_jobs():
+    deadline = time.monotonic() + 5
+    while jobs.metrics()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_job_runs_after_commit(app):
+    calls.clear()
+    with app.app_context():
+        db.session.add(Planet(name="Hoth", description="ice", image_url="url"))
+        jobs.enqueue("record", value="hoth")
+        wait_for_jobs()
+        assert calls == []
+
+        db.session.commit()
+        wait_for_jobs()
+        assert calls == ["hoth"]
+
+
+def test_rollback_drops_the_job(app):
+    calls.clear()
+    before = jobs.metrics()
+    with app.app_context():
+        db.session.add(Planet(name="Hoth", description="ice", image_url="url"))
+        jobs.enqueue("record", value="hoth")
+        db.session.rollback()
+        db.session.commit()
+        wait_for_jobs()
+
+    after = jobs.metrics()
+    assert calls == []
+    assert after["dropped"] == before["dropped"] + 1
+    assert after["enqueued"] == before["enqueued"]
+
+
+def test_savepoint_rollback_keeps_the_outer_jobs(app):
+    calls.clear()
+    before = jobs.metrics()
+    with app.app_context():
+        db.session.add(Planet(name="Hoth", description="ice", image_url="url"))
+        jobs.enqueue("record", value="outer")
+        savepoint = db.session.begin_nested()
+        jobs.enqueue("record", value="inner")
+        savepoint.rollback()
+        db.session.commit()
+        wait_for_jobs()
+
+    after = jobs.metrics()
+    assert calls == ["outer"]
+    assert after["enqueued"] == before["enqueued"] + 1
+    assert after["dropped"] == before["dropped"] + 1
+
+
+def test_failed_job_is_retried_with_backoff(app, monkeypatch):
+    calls.clear()
+    monkeypatch.setattr(jobs, "backoff", 0.01)
+    before = jobs.metrics()
+    with app.app_context():
+        jobs.enqueue("record", value="flaky", fail_times=2)
+        wait_for_jobs()
+
+    after = jobs.metrics()
+    assert calls == ["flaky"] * 3
+    assert after["retried"] == before["retried"] + 2
+    assert after["completed"] == before["completed"] + 1
+
+
+def test_job_fails_after_max_retries(app, monkeypatch):
+    calls.clear()
+    monkeypatch.setattr(jobs, "backoff", 0.01)
+    before = jobs.metrics()
+    with app.app_context():
+        jobs.enqueue("record", value="broken", fail_times=jobs.max_retries)
+        wait_for_jobs()
+
+    assert calls == ["broken"] * jobs.max_retries
+    assert jobs.metrics()["failed"] == before["failed"] + 1
+
+
+def test_metrics_endpoint(client):
+    client.post('/api/planets', json={"name": "Hoth", "description": "ice", "image_url": "url"})
+
+    response = client.get('/api/jobs/metrics')
+
+    assert response.status_code == 200
+    assert response.json["mode"] == "memory"
+    assert response.json["enqueued"] >= 1
+    assert {"dropped", "in_flight", "completed", "retried", "failed", "depth"} <= set(response.json)
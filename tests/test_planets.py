@@ -0,0 +1,46 @@
+from conftest import quiet
+from models import Character
+from seed import seed
+
+
+def test_planet_embeds_residents(client):
+    client.post('/api/planets', json={"name": "Tatooine", "description": "desert", "image_url": "url"})
+    client.post('/api/people', json={"name": "Luke", "description": "farm boy", "image_url": "url", "planet_id": 1})
+
+    response = client.get('/api/planets/Tatooine')
+
+    assert response.status_code == 200
+    assert response.json["people"] == [{"id": 1, "name": "Luke"}]
+
+
+def test_get_planets_query_count_is_constant(app, client, queries):
+    with app.app_context():
+        seed(users=0, planets=600, characters=3000, favorites=0, posts=0, echo=quiet)
+
+    queries.clear()
+    response = client.get('/api/planets?limit=1000')
+
+    assert response.status_code == 200
+    assert len(response.json["planets"]) == 100
+    assert response.json["limit"] == 100
+    assert len(queries) == 2
+
+    queries.clear()
+    response = client.get('/api/planets?offset=550&residents=count')
+
+    assert len(response.json["planets"]) == 50
+    assert all("resident_count" in planet for planet in response.json["planets"])
+    assert len(queries) == 2
+
+
+def test_get_planets_pages_residents(app, client):
+    with app.app_context():
+        seed(users=0, planets=3, characters=30, favorites=0, posts=0, echo=quiet)
+
+    first = client.get('/api/planets?limit=2').json["planets"]
+    second = client.get('/api/planets?limit=2&offset=2').json["planets"]
+
+    assert [planet["id"] for planet in first + second] == [1, 2, 3]
+    residents = sum(len(planet["people"]) for planet in first + second)
+    with app.app_context():
+        assert residents == Character.query.count() == 30
@@ -0,0 +1,96 @@
+import marshal
+import pstats
+
+import pytest
+
+from conftest import quiet
+from seed import seed
+
+TOKEN = {"X-Profile": "s3cret"}
+
+
+@pytest.fixture
+def profiled(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILING_TOKEN', 's3cret')
+    with app.app_context():
+        seed(users=0, planets=200, characters=2000, favorites=0, posts=0, echo=quiet)
+    return app
+
+
+def profile(client, fmt):
+    response = client.get('/api/planets?limit=100', headers=TOKEN)
+    return client.get(f'/api/profiles/{response.headers["X-Profile-Id"]}?format={fmt}', headers=TOKEN)
+
+
+def test_profiles_require_the_token(client, profiled):
+    assert client.get('/api/profiles').status_code == 404
+    assert client.get('/api/profiles', headers={"X-Profile": "wrong"}).status_code == 404
+
+    response = client.get('/api/planets', headers=TOKEN)
+    assert "X-Profile-Id" in response.headers
+
+    profiles = client.get('/api/profiles', headers=TOKEN).json["profiles"]
+    assert profiles[0]["path"] == "/api/planets"
+
+
+def test_text_report(client, profiled):
+    response = profile(client, "text")
+
+    assert response.status_code == 200
+    assert "function calls" in response.data.decode()
+    assert "get_planets" in response.data.decode()
+
+
+def test_pstats_dump_loads(client, profiled, tmp_path):
+    response = profile(client, "pstats")
+    dump = tmp_path / "profile.prof"
+    dump.write_bytes(response.data)
+
+    stats = pstats.Stats(str(dump))
+
+    assert stats.stats == marshal.loads(response.data)
+    assert any(func[2] == "get_planets" for func in stats.stats)
+
+
+def test_collapsed_adds_up_to_the_request(client, profiled):
+    response = client.get('/api/planets?limit=100', headers=TOKEN)
+    profile_id = response.headers["X-Profile-Id"]
+    duration_ms = client.get('/api/profiles', headers=TOKEN).json["profiles"][0]["duration_ms"]
+
+    collapsed = client.get(f'/api/profiles/{profile_id}?format=collapsed', headers=TOKEN).data.decode()
+    total_us = sum(int(line.rsplit(" ", 1)[1]) for line in collapsed.splitlines())
+
+    assert any(line.split(" ")[0].endswith("(get_planets)") for line in collapsed.splitlines())
+    # cumulative weights used to count the same time once per ancestor frame, many times over
+    assert 0.2 * duration_ms * 1000 < total_us <= 1.05 * duration_ms * 1000
+
+
+def test_sql_is_captured(client, profiled):
+    response = profile(client, "sql")
+
+    assert response.status_code == 200
+    statements = [query["statement"] for query in response.json["sql"]]
+    assert len(statements) == response.json["queries"] == 2
+    assert statements[0].startswith("SELECT") and "FROM planets" in statements[0]
+    assert "FROM characters" in statements[1]
+
+
+def test_sampling_mode(client, profiled, monkeypatch):
+    monkeypatch.setitem(profiled.config, 'PROFILING_MODE', 'sampling')
+    monkeypatch.setitem(profiled.config, 'PROFILING_INTERVAL', 0.0005)
+    response = client.get('/api/planets?limit=100', headers=TOKEN)
+    profile_id = response.headers["X-Profile-Id"]
+
+    assert client.get('/api/profiles', headers=TOKEN).json["profiles"][0]["mode"] == "sampling"
+    assert client.get(f'/api/profiles/{profile_id}?format=text', headers=TOKEN).status_code == 400
+    collapsed = client.get(f'/api/profiles/{profile_id}?format=collapsed', headers=TOKEN).data.decode()
+    for line in collapsed.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and "(" in stack
+    assert client.get(f'/api/profiles/{profile_id}?format=sql', headers=TOKEN).json["queries"] == 2
+
+
+def test_sample_rate_profiles_without_the_header(client, profiled, monkeypatch):
+    monkeypatch.setitem(profiled.config, 'PROFILING_SAMPLE_RATE', 1.0)
+
+    assert "X-Profile-Id" in client.get('/api/planets').headers
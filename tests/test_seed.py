@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from conftest import quiet
+from models import db, Favorite, Post, User
+from seed import seed
+
+
+def duplicate_favorites():
+    return db.session.query(Favorite.user_id, Favorite.planet_id, Favorite.character_id) \
+        .group_by(Favorite.user_id, Favorite.planet_id, Favorite.character_id) \
+        .having(func.count() > 1) \
+        .count()
+
+
+def test_favorites_are_unique(app):
+    with app.app_context():
+        seed(users=10, planets=2, characters=100, favorites=100, posts=0, echo=quiet)
+
+        assert Favorite.query.count() == 100
+        assert duplicate_favorites() == 0
+
+
+def test_favorites_without_planets(app):
+    with app.app_context():
+        seed(users=10, planets=0, characters=100, favorites=100, posts=0, echo=quiet)
+
+        assert Favorite.query.filter(Favorite.planet_id.isnot(None)).count() == 0
+        assert duplicate_favorites() == 0
+
+
+def test_seeded_timestamps_match_orm_values(app):
+    with app.app_context():
+        seed(users=5, planets=0, characters=0, favorites=0, posts=3, echo=quiet)
+
+        assert Post.query.filter(Post.created_at == datetime(2024, 1, 1)).count() == 1
+        assert User.query.filter(User.created_at == datetime(2024, 1, 1, 0, 1)).count() == 1
+
+
+def seeded_rows(app, seed_value):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(users=20, planets=5, characters=50, favorites=60, posts=100, seed=seed_value, echo=quiet)
+        return {
+            table.name: db.session.execute(select(table).order_by(*table.primary_key.columns)).all()
+            for table in db.metadata.sorted_tables
+        }
+
+
+def test_same_seed_same_rows(app):
+    first = seeded_rows(app, 7)
+    second = seeded_rows(app, 7)
+
+    assert first == second
+    assert len(first["posts"]) == 100
+    assert seeded_rows(app, 8)["posts"] != first["posts"]
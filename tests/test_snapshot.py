@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import quiet
+from models import db, User, Planet, Character, Favorite, Post
+from seed import seed
+from snapshot import export_snapshot, import_snapshot
+
+
+def test_export_then_import_keeps_every_row(app, tmp_path):
+    with app.app_context():
+        seed(users=20, planets=5, characters=50, favorites=40, posts=60, echo=quiet)
+        before = {model: model.query.count() for model in (User, Planet, Character, Favorite, Post)}
+
+        export_snapshot(str(tmp_path), fmt="ndjson", chunk_size=7, echo=quiet)
+        import_snapshot(str(tmp_path), chunk_size=7, truncate=True, echo=quiet)
+        db.session.expire_all()
+
+        assert {model: model.query.count() for model in before} == before
+        assert db.session.get(Character, 1).planet_id is not None
+
+
+def test_export_doesnt_see_rows_written_during_it(app, tmp_path):
+    with app.app_context():
+        seed(users=5, planets=2, characters=5, favorites=0, posts=10, echo=quiet)
+        engine = db.engine
+    with engine.connect() as conn:
+        # WAL lets the writer go ahead instead of waiting for the export's read transaction
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+    def write_during_export(message):
+        if message.startswith("exported users"):
+            with engine.begin() as other:
+                other.execute(Post.__table__.insert(), {"title": "late", "content": "c", "user_id": 1})
+
+    try:
+        with app.app_context():
+            manifest = export_snapshot(str(tmp_path), fmt="ndjson", echo=write_during_export)
+            assert Post.query.count() == 11
+    finally:
+        # leaving WAL needs the only connection to the file
+        engine.dispose()
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=DELETE")
+
+    rows = {table["name"]: table["rows"] for table in manifest["tables"]}
+    assert rows["posts"] == 10
+
+
+def test_parquet_round_trip(app, tmp_path):
+    pytest.importorskip("pyarrow")
+    with app.app_context():
+        seed(users=20, planets=5, characters=50, favorites=40, posts=60, echo=quiet)
+        before = {model: model.query.count() for model in (User, Planet, Character, Favorite, Post)}
+
+        export_snapshot(str(tmp_path), fmt="parquet", chunk_size=7, echo=quiet)
+        import_snapshot(str(tmp_path), chunk_size=7, truncate=True, echo=quiet)
+        db.session.expire_all()
+
+        assert {model: model.query.count() for model in before} == before
+        assert db.session.get(Post, 1).created_at == datetime(2024, 1, 1)